@@ -2,12 +2,29 @@
 """
 Side-by-Side File Comparison Tool
 Compares two files line by line and displays differences highlighted in color.
+Install the optional diff-match-patch package for faster character-level diffs.
 """
 
 import argparse
+import array
+import collections
+import concurrent.futures
+import contextlib
+import functools
+import itertools
+import mmap
+import operator
+import os
+import re
+import stat
 import sys
 import difflib
-from typing import List, Tuple
+from typing import BinaryIO, Iterator, List, Optional, Tuple
+
+try:
+    from diff_match_patch import diff_match_patch
+except ImportError:  # Optional, difflib is used when it is not installed
+    diff_match_patch = None
 
 # ANSI color codes for terminal output
 class Colors:
@@ -27,214 +44,559 @@ class Colors:
     BG_RED = '\033[41m'
     BG_GREEN = '\033[42m'
     BG_YELLOW = '\033[43m'
+    
+    # Highlight for changed characters, BG_YELLOW and BLACK merged into one sequence
+    HIGHLIGHT = '\033[43;30m'
+
+# Myers-based differ for character-level highlights, bounded to 100ms per line
+if diff_match_patch is not None:
+    _dmp = diff_match_patch()
+    _dmp.Diff_Timeout = 0.1
+else:
+    _dmp = None
+
+# Escape codes that open highlighted text in the (left, right) column for each --style
+_STYLES = {
+    'changed-only': (Colors.HIGHLIGHT, Colors.HIGHLIGHT),
+    'add-remove': (Colors.BG_RED, Colors.BG_GREEN),
+}
+
+# ANSI escape sequences understood by wrap_line, group 1 only matches for color/formatting codes
+_ANSI_RE = re.compile(r'\x1b\[[0-9;]*(?:(m)|[HJK])')
+
+# Chunk size used by files_identical when comparing raw file contents
+_COMPARE_CHUNK_SIZE = 1 << 20
+
+# Work budget for the line-level Myers diff, in diagonal steps per line (with a floor for
+# small files). Beyond it difflib's heuristic matcher is cheaper than an exact diff.
+_MYERS_STEPS_PER_LINE = 10
+_MIN_MYERS_STEPS = 10000
+
+# Aligned rows rendered per batch in compare_files, and differing pairs sent to each worker task
+_HIGHLIGHT_BATCH_SIZE = 4096
+_HIGHLIGHT_CHUNK_SIZE = 64
+
+# Output queued by emit, written to the stdout file descriptor in 64 KiB blocks
+_STDOUT_FD = 1
+_OUTPUT_BUFFER = bytearray()
+_OUTPUT_BUFFER_LIMIT = 1 << 16
+
+# Beyond these sizes (of the differing middles, after the shared prefix and suffix are
+# trimmed) a character-level diff costs more than it helps, so the middles are highlighted whole
+_MAX_DIFF_LINE_LENGTH = 10000
+_MAX_DIFF_LENGTH_DELTA = 2000
 
-def read_file_lines(filename: str) -> List[str]:
-    """Read all lines from a file."""
+# Equal-length lines are compared position by position unless more than this share differs
+_MAX_POSITIONAL_DIFF_RATIO = 0.5
+
+def open_file(filename: str) -> BinaryIO:
+    """Open a file for reading as raw bytes, lines are decoded only when displayed."""
     try:
-        with open(filename, 'r', encoding='utf-8') as f:
-            return f.readlines()
+        return open(filename, 'rb', buffering=1 << 20)
     except FileNotFoundError:
         print(f"Error: File '{filename}' not found.")
         sys.exit(1)
-    except UnicodeDecodeError:
-        print(f"Error: Could not decode '{filename}' as UTF-8.")
-        sys.exit(1)
 
-def highlight_char_differences(line1: str, line2: str) -> Tuple[str, str]:
-    """Highlight blocks of characters that were changed between two lines.
-    Groups nearby changes and ensures both sides highlight the same positions."""
-    
-    if len(line1) != len(line2):
-        # If lengths differ, just highlight everything (shouldn't happen in your use case)
-        return (f"{Colors.BG_YELLOW}{Colors.BLACK}{line1}{Colors.END}",
-                f"{Colors.BG_YELLOW}{Colors.BLACK}{line2}{Colors.END}")
-    
-    # Find all positions where characters differ
-    diff_positions = []
-    for i in range(min(len(line1), len(line2))):
-        if line1[i] != line2[i]:
-            diff_positions.append(i)
+def read_file_lines(f: BinaryIO) -> List[bytes]:
+    """Read all lines from an open file, without their line endings.
+    bytes.splitlines() breaks on exactly the endings text mode recognizes: \\n, \\r\\n and \\r."""
+    return f.read().splitlines()
+
+def decode_line(line: Optional[bytes]) -> str:
+    """Decode a raw line for display, a line missing from one side shows as empty."""
+    return line.decode('utf-8', 'replace') if line is not None else ''
+
+def files_identical(f1: BinaryIO, f2: BinaryIO) -> bool:
+    """Check whether two open files hold byte-identical contents, without decoding them."""
+    stat1 = os.fstat(f1.fileno())
+    stat2 = os.fstat(f2.fileno())
+    if not (stat.S_ISREG(stat1.st_mode) and stat.S_ISREG(stat2.st_mode)):
+        return False
+    if stat1.st_size != stat2.st_size:
+        return False
+    if os.path.samestat(stat1, stat2):
+        return True
     
-    if not diff_positions:
-        return line1, line2
+    # Compare memory-mapped chunks, each comparison is a single memcmp. Files that
+    # can't be mapped (empty files, procfs and sysfs entries) take the normal path.
+    try:
+        with mmap.mmap(f1.fileno(), 0, access=mmap.ACCESS_READ) as mm1, \
+                mmap.mmap(f2.fileno(), 0, access=mmap.ACCESS_READ) as mm2:
+            for offset in range(0, stat1.st_size, _COMPARE_CHUNK_SIZE):
+                end = offset + _COMPARE_CHUNK_SIZE
+                if mm1[offset:end] != mm2[offset:end]:
+                    return False
+    except (OSError, ValueError):
+        return False
+    return True
+
+def _common_prefix_length(a: str, b: str) -> int:
+    """Return the length of the longest common prefix of two strings.
+    Binary search over slice comparisons keeps the scanning in C."""
+    lo, hi = 0, min(len(a), len(b))
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if a[lo:mid] == b[lo:mid]:
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo
+
+def _render_spans(spans: List[Tuple[bool, str]], highlight: str) -> str:
+    """Join (highlighted, text) spans into a line.
+    Neighbouring spans with the same style are merged so each highlighted run
+    is wrapped in a single pair of escape sequences."""
+    result = []
+    for highlighted, group in itertools.groupby(spans, key=operator.itemgetter(0)):
+        texts = [span[1] for span in group if span[1]]
+        if not texts:
+            continue
+        # Append the pieces as they are, the final join is the only concatenation
+        if highlighted:
+            result.append(highlight)
+            result.extend(texts)
+            result.append(Colors.END)
+        else:
+            result.extend(texts)
+    return ''.join(result)
+
+def _highlight_edits(line1: str, line2: str, style: str) -> Tuple[str, str]:
+    """Highlight a character-level edit script between two lines whose positions don't line up,
+    either because their lengths differ or because too many equal-length positions differ.
+    Uses diff-match-patch when available and falls back to difflib."""
+    spans1 = []
+    spans2 = []
     
-    # Group nearby differences (within 2 characters of each other)
-    groups = []
-    current_group = [diff_positions[0]]
+    if _dmp is not None:
+        diffs = _dmp.diff_main(line1, line2)
+        _dmp.diff_cleanupSemantic(diffs)
+        for op, text in diffs:
+            if op == _dmp.DIFF_EQUAL:
+                spans1.append((False, text))
+                spans2.append((False, text))
+            elif op == _dmp.DIFF_DELETE:
+                spans1.append((True, text))
+            else:
+                spans2.append((True, text))
+    else:
+        matcher = difflib.SequenceMatcher(None, line1, line2, autojunk=True)
+        for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+            changed = tag != 'equal'
+            spans1.append((changed, line1[i1:i2]))
+            spans2.append((changed, line2[j1:j2]))
     
-    for pos in diff_positions[1:]:
-        if pos - current_group[-1] <= 2:  # Group if within 2 characters
-            current_group.append(pos)
-        else:
-            groups.append(current_group)
-            current_group = [pos]
-    groups.append(current_group)
+    highlight1, highlight2 = _STYLES[style]
+    return _render_spans(spans1, highlight1), _render_spans(spans2, highlight2)
+
+def _highlight_positions(line1: str, line2: str, diff_positions: List[int],
+                         style: str) -> Tuple[str, str]:
+    """Highlight the given differing positions of two equal-length lines."""
     
-    # Convert groups to ranges (start, end)
+    # Merge nearby differences (within 2 characters of each other) into ranges (start, end)
     ranges = []
-    for group in groups:
-        start = group[0]
-        end = group[-1] + 1  # +1 to make it inclusive
-        ranges.append((start, end))
+    range_start = previous = diff_positions[0]
+    for pos in itertools.islice(diff_positions, 1, None):
+        if pos - previous > 2:
+            ranges.append((range_start, previous + 1))
+            range_start = pos
+        previous = pos
+    ranges.append((range_start, previous + 1))  # +1 to make it inclusive
     
     # Build the highlighted strings
-    result1 = []
-    result2 = []
+    spans1 = []
+    spans2 = []
     last_end = 0
     
     for start, end in ranges:
         # Add unchanged text before this range
-        result1.append(line1[last_end:start])
-        result2.append(line2[last_end:start])
+        spans1.append((False, line1[last_end:start]))
+        spans2.append((False, line2[last_end:start]))
         
         # Add highlighted changed text
-        result1.append(f"{Colors.BG_YELLOW}{Colors.BLACK}{line1[start:end]}{Colors.END}")
-        result2.append(f"{Colors.BG_YELLOW}{Colors.BLACK}{line2[start:end]}{Colors.END}")
+        spans1.append((True, line1[start:end]))
+        spans2.append((True, line2[start:end]))
         
         last_end = end
     
     # Add any remaining unchanged text
-    result1.append(line1[last_end:])
-    result2.append(line2[last_end:])
+    spans1.append((False, line1[last_end:]))
+    spans2.append((False, line2[last_end:]))
     
-    return ''.join(result1), ''.join(result2)
+    highlight1, highlight2 = _STYLES[style]
+    return _render_spans(spans1, highlight1), _render_spans(spans2, highlight2)
 
-def wrap_line(line: str, width: int) -> List[str]:
-    """Wrap a line to fit within specified width, preserving ANSI color codes across wraps."""
-    if not line:
-        return ['']
+@functools.lru_cache(maxsize=4096)
+def highlight_char_differences(line1: str, line2: str, style: str = 'changed-only') -> Tuple[str, str]:
+    """Highlight blocks of characters that were changed between two lines.
+    Equal-length lines with few changes are compared position by position, grouping nearby
+    changes so both sides highlight the same positions; other lines get a character diff.
+    Results are cached, since repeated line pairs are common in config and log diffs."""
+    
+    # Skip the shared prefix and suffix, only the middle can contain differences
+    start = _common_prefix_length(line1, line2)
+    if start == len(line1) == len(line2):
+        return line1, line2
+    suffix = _common_prefix_length(line1[start:][::-1], line2[start:][::-1])
+    end1 = len(line1) - suffix
+    end2 = len(line2) - suffix
+    
+    highlight1, highlight2 = _STYLES[style]
+    if not line1 or not line2:
+        # Added or removed text only, there is nothing to line up
+        return _render_spans([(True, line1)], highlight1), _render_spans([(True, line2)], highlight2)
+    
+    if len(line1) == len(line2):
+        # Find all positions where characters differ in a single linear pass
+        diff_positions = list(itertools.compress(
+            range(start, end1), map(operator.ne, line1[start:end1], line2[start:end1])))
+        if len(diff_positions) <= len(line1) * _MAX_POSITIONAL_DIFF_RATIO:
+            return _highlight_positions(line1, line2, diff_positions, style)
+        # Too many mismatches to be in-place edits, most likely shifted text
+    
+    # Positions don't line up, so diff the differing middles instead. A middle that is
+    # empty is a plain insertion or deletion, and oversized middles are highlighted whole.
+    middle1 = line1[start:end1]
+    middle2 = line2[start:end2]
+    if (not middle1 or not middle2
+            or max(len(middle1), len(middle2)) > _MAX_DIFF_LINE_LENGTH
+            or abs(len(middle1) - len(middle2)) > _MAX_DIFF_LENGTH_DELTA):
+        middle1 = _render_spans([(True, middle1)], highlight1)
+        middle2 = _render_spans([(True, middle2)], highlight2)
+    else:
+        middle1, middle2 = _highlight_edits(middle1, middle2, style)
+    return (line1[:start] + middle1 + line1[end1:],
+            line2[:start] + middle2 + line2[end2:])
+
+@functools.lru_cache(maxsize=8192)
+def wrap_line(line: str, width: int) -> Tuple[str, ...]:
+    """Wrap a line to fit within specified width, preserving ANSI color codes across wraps.
+    Results are cached, since blank lines, braces and imports repeat throughout most files."""
+    if len(line) <= width and '\033' not in line:
+        # Plain text that already fits, which covers most lines
+        return (line,)
     
     wrapped_lines = []
-    current_line = ""
+    current_line = []  # Pieces of the row being built, joined once per row
     visible_length = 0
-    i = 0
     active_formatting = []  # Stack to track active formatting codes
     
-    while i < len(line):
-        if line[i:i+1] == '\033':  # ANSI escape sequence start
-            # Find the end of the ANSI sequence
-            end = i + 1
-            while end < len(line) and line[end] not in ['m', 'H', 'J', 'K']:
-                end += 1
-            if end < len(line):
-                end += 1
-            
-            ansi_code = line[i:end]
-            current_line += ansi_code
+    # Alternate between the plain text before each ANSI sequence and the sequence itself
+    pos = 0
+    for match in itertools.chain(_ANSI_RE.finditer(line), [None]):
+        text_end = match.start() if match else len(line)
+        while pos < text_end:
+            if visible_length >= width:
+                # End current line with reset and start next with active formatting
+                current_line.append(Colors.END)
+                wrapped_lines.append(''.join(current_line))
+                current_line = active_formatting[:]  # Restore formatting on new line
+                visible_length = 0
+            chunk_end = min(text_end, pos + width - visible_length)
+            current_line.append(line[pos:chunk_end])
+            visible_length += chunk_end - pos
+            pos = chunk_end
+        
+        if match:
+            ansi_code = match.group()
+            current_line.append(ansi_code)
             
             # Track formatting state
-            if 'm' in ansi_code:  # Color/formatting code
+            if match.lastindex:  # Color/formatting code
                 if ansi_code == Colors.END:
                     active_formatting = []  # Reset clears all
                 else:
                     # Add to active formatting (simplified tracking)
                     active_formatting.append(ansi_code)
             
-            i = end
-        else:
-            if visible_length >= width:
-                # End current line with reset and start next with active formatting
-                wrapped_lines.append(current_line + Colors.END)
-                current_line = ''.join(active_formatting)  # Restore formatting on new line
-                visible_length = 0
-            current_line += line[i]
-            visible_length += 1
-            i += 1
+            pos = match.end()
     
     if current_line or not wrapped_lines:
         # Ensure final line ends with reset if it contains formatting
         if active_formatting:
-            current_line += Colors.END
-        wrapped_lines.append(current_line)
+            current_line.append(Colors.END)
+        wrapped_lines.append(''.join(current_line))
     
-    return wrapped_lines
+    return tuple(wrapped_lines)
 
-def compare_files(file1_path: str, file2_path: str, width: int = 120, no_color: bool = False):
-    """Compare two files and display side by side with highlighted differences."""
+def _myers_opcodes(a: List[int], b: List[int]) -> Optional[List[Tuple[str, int, int, int, int]]]:
+    """Compute a minimal line diff with Myers' O((N+M)D) algorithm.
+    Returns difflib-style opcodes, or None when the search would exceed its work budget.
+    Each step's frontier is appended to one flat array instead of copying V per step."""
+    n, m = len(a), len(b)
+    budget = max(_MYERS_STEPS_PER_LINE * (n + m), _MIN_MYERS_STEPS)
     
-    # Read files
-    lines1 = read_file_lines(file1_path)
-    lines2 = read_file_lines(file2_path)
+    # Every line occurrence without a partner on the other side costs one edit, and reaching
+    # edit distance d takes about d*d/2 steps, so hopeless inputs are rejected before searching
+    counts = collections.Counter(a)
+    counts.subtract(b)
+    min_edits = sum(map(abs, counts.values()))
+    if min_edits * (min_edits + 1) // 2 > budget:
+        return None
     
-    # Pad shorter file with empty lines
-    max_lines = max(len(lines1), len(lines2))
-    lines1 += [''] * (max_lines - len(lines1))
-    lines2 += [''] * (max_lines - len(lines2))
+    offset = n + m + 1
+    v = array.array('i', [0]) * (2 * offset + 1)  # v[offset + k]: furthest x on diagonal k
+    history = array.array('i')  # frontier v[-d..d] of every step d, back to back
+    starts = []  # index in history where the frontier of step d begins
     
-    # Calculate column width (leave space for line numbers and separator)
-    col_width = (width - 7) // 2  # 7 chars for line numbers, marker, and separator
+    steps = 0
+    for d in range(n + m + 1):
+        steps += d + 1
+        if steps > budget:
+            return None
+        for k in range(-d, d + 1, 2):
+            if k == -d or (k != d and v[offset + k - 1] < v[offset + k + 1]):
+                x = v[offset + k + 1]  # Step down, an insertion
+            else:
+                x = v[offset + k - 1] + 1  # Step right, a deletion
+            y = x - k
+            while x < n and y < m and a[x] == b[y]:
+                x += 1
+                y += 1
+            v[offset + k] = x
+            if x >= n and y >= m:
+                return _myers_backtrack(n, m, d, history, starts)
+        starts.append(len(history))
+        history.extend(v[offset - d:offset + d + 1])
+    return None
+
+def _myers_backtrack(n: int, m: int, edits: int, history: array.array,
+                     starts: List[int]) -> List[Tuple[str, int, int, int, int]]:
+    """Walk the saved frontiers of _myers_opcodes back from (n, m) and build opcodes."""
+    steps = []  # (i1, i2, j1, j2) of each diagonal run or single edit, last one first
+    x, y = n, m
+    for d in range(edits, 0, -1):
+        base = starts[d - 1] + d - 1  # history[base + k] is diagonal k of step d - 1
+        k = x - y
+        if k == -d or (k != d and history[base + k - 1] < history[base + k + 1]):
+            prev_k = k + 1
+        else:
+            prev_k = k - 1
+        prev_x = history[base + prev_k]
+        prev_y = prev_x - prev_k
+        
+        # Diagonal run back to the end of the edit, then the edit itself
+        mid_x, mid_y = (prev_x, prev_y + 1) if prev_k == k + 1 else (prev_x + 1, prev_y)
+        steps.append(('equal', mid_x, x, mid_y, y))
+        steps.append(('edit', prev_x, mid_x, prev_y, mid_y))
+        x, y = prev_x, prev_y
+    steps.append(('equal', 0, x, 0, y))
     
-    # Print header
-    header1 = f"{Colors.BOLD}{file1_path}{Colors.END}" if not no_color else file1_path
-    header2 = f"{Colors.BOLD}{file2_path}{Colors.END}" if not no_color else file2_path
+    # Merge consecutive edits into difflib-style replace/delete/insert opcodes
+    opcodes = []
+    pending = None
+    for tag, i1, i2, j1, j2 in reversed(steps):
+        if tag == 'edit':
+            pending = (pending[0], i2, pending[2], j2) if pending else (i1, i2, j1, j2)
+            continue
+        if i1 == i2:
+            continue
+        if pending:
+            opcodes.append(_edit_opcode(*pending))
+            pending = None
+        opcodes.append(('equal', i1, i2, j1, j2))
+    if pending:
+        opcodes.append(_edit_opcode(*pending))
+    return opcodes
+
+def _edit_opcode(i1: int, i2: int, j1: int, j2: int) -> Tuple[str, int, int, int, int]:
+    """Name a block of edits the way difflib does."""
+    if i1 < i2 and j1 < j2:
+        return 'replace', i1, i2, j1, j2
+    return ('delete' if i1 < i2 else 'insert'), i1, i2, j1, j2
+
+def align_lines(lines1: List[bytes], lines2: List[bytes]) -> Iterator[Tuple[Optional[int], Optional[bytes], Optional[bytes]]]:
+    """Pair up the lines of two files using a line-level diff, so an inserted or deleted
+    line doesn't shift every line after it out of alignment.
+    Yields (line number in the first file, line1, line2) with None for a missing side."""
+    # Unchanged leading and trailing lines need no diff at all
+    n, m = len(lines1), len(lines2)
+    prefix = 0
+    while prefix < min(n, m) and lines1[prefix] == lines2[prefix]:
+        prefix += 1
+    suffix = 0
+    while suffix < min(n, m) - prefix and lines1[n - 1 - suffix] == lines2[m - 1 - suffix]:
+        suffix += 1
+    middle1 = lines1[prefix:n - suffix]
+    middle2 = lines2[prefix:m - suffix]
     
-    print("=" * width)
-    print(f"{'':>5} {header1:<{col_width}} | {header2}")
-    print("=" * width)
+    # Number distinct lines so the diff compares small ints instead of strings
+    ids = {}
+    opcodes = _myers_opcodes([ids.setdefault(line, len(ids)) for line in middle1],
+                             [ids.setdefault(line, len(ids)) for line in middle2])
+    if opcodes is None:
+        # Too many edits for Myers to stay fast, fall back to difflib's heuristic matcher
+        opcodes = difflib.SequenceMatcher(None, middle1, middle2).get_opcodes()
+    opcodes = [(tag, i1 + prefix, i2 + prefix, j1 + prefix, j2 + prefix)
+               for tag, i1, i2, j1, j2 in opcodes]
+    opcodes.insert(0, ('equal', 0, prefix, 0, prefix))
+    opcodes.append(('equal', n - suffix, n, m - suffix, m))
     
-    # Compare and display lines
-    diff_count = 0
-    for i, (line1, line2) in enumerate(zip(lines1, lines2), 1):
-        line1 = line1.rstrip('\n\r')
-        line2 = line2.rstrip('\n\r')
+    for tag, i1, i2, j1, j2 in opcodes:
+        if tag == 'equal':
+            for i in range(i1, i2):
+                yield i + 1, lines1[i], lines1[i]
+            continue
         
-        # Check if lines are different
-        if line1 != line2:
-            diff_count += 1
-            
-            if not no_color:
-                # Highlight character-level differences
-                highlighted1, highlighted2 = highlight_char_differences(line1, line2)
-                line_num_color = Colors.YELLOW
-                marker = f"{Colors.RED}*{Colors.END}"
-            else:
-                highlighted1, highlighted2 = line1, line2
-                line_num_color = ""
-                marker = "*"
-            
-            # Wrap lines if they're too long
-            wrapped1 = wrap_line(highlighted1, col_width)
-            wrapped2 = wrap_line(highlighted2, col_width)
-            
-            # Make both wrapped lists the same length
-            max_wrapped = max(len(wrapped1), len(wrapped2))
-            wrapped1 += [''] * (max_wrapped - len(wrapped1))
-            wrapped2 += [''] * (max_wrapped - len(wrapped2))
-            
-            # Print all wrapped lines
-            for j, (w1, w2) in enumerate(zip(wrapped1, wrapped2)):
-                if j == 0:  # First line gets the line number and marker
-                    line_num = f"{line_num_color}{i:4d}{Colors.END if not no_color else ''}"
-                    print(f"{line_num}{marker} {w1:<{col_width}} | {w2}")
-                else:  # Continuation lines get spaces
-                    print(f"{'':>5} {w1:<{col_width}} | {w2}")
+        # Replaced lines are paired up for a character diff, the rest are deletions or insertions
+        paired = min(i2 - i1, j2 - j1)
+        for k in range(paired):
+            yield i1 + k + 1, lines1[i1 + k], lines2[j1 + k]
+        for i in range(i1 + paired, i2):
+            yield i + 1, lines1[i], None
+        for j in range(j1 + paired, j2):
+            yield None, None, lines2[j]
+
+def emit(text: str) -> None:
+    """Queue a line of output, writing the buffer out once it reaches _OUTPUT_BUFFER_LIMIT."""
+    _OUTPUT_BUFFER.extend(text.encode('utf-8'))
+    _OUTPUT_BUFFER.extend(b'\n')
+    if len(_OUTPUT_BUFFER) >= _OUTPUT_BUFFER_LIMIT:
+        flush_output()
+
+def flush_output() -> None:
+    """Write all buffered output straight to the stdout file descriptor."""
+    sys.stdout.flush()  # Keep ordering with anything printed through sys.stdout
+    try:
+        with memoryview(_OUTPUT_BUFFER) as view:
+            written = 0
+            while written < len(view):
+                written += os.write(_STDOUT_FD, view[written:])
+    finally:
+        # Drop the buffer even if the write failed, so nothing is written twice
+        _OUTPUT_BUFFER.clear()
+
+def compare_files(file1_path: str, file2_path: str, width: int = 120, no_color: bool = False,
+                  jobs: int = 1, style: str = 'changed-only'):
+    """Compare two files and display side by side with highlighted differences."""
+    
+    with contextlib.ExitStack() as stack:
+        # Read files up front so a missing file is reported before any output
+        f1 = stack.enter_context(open_file(file1_path))
+        f2 = stack.enter_context(open_file(file2_path))
+        stack.callback(flush_output)
+        
+        if files_identical(f1, f2):
+            # Byte-identical files, show the first one in both columns instead of diffing
+            rows = ((i, line, line) for i, line in enumerate(read_file_lines(f1), 1))
         else:
-            # Lines are identical
-            wrapped = wrap_line(line1, col_width)
+            rows = align_lines(read_file_lines(f1), read_file_lines(f2))
+        
+        # Calculate column width (leave space for line numbers and separator)
+        col_width = (width - 7) // 2  # 7 chars for line numbers, marker, and separator
+        
+        # Print header
+        header1 = f"{Colors.BOLD}{file1_path}{Colors.END}" if not no_color else file1_path
+        header2 = f"{Colors.BOLD}{file2_path}{Colors.END}" if not no_color else file2_path
+        
+        emit("=" * width)
+        emit(f"{'':>5} {header1:<{col_width}} | {header2}")
+        emit("=" * width)
+        
+        # Compare and display lines
+        diff_count = 0
+        total_lines = 0
+        
+        # Prepare row formats and colors once rather than reparsing format specs on every line
+        row_fmt = f"%s%s %-{col_width}s | %s"  # Line number, marker, left and right column
+        blank_num = ' ' * 4
+        if no_color:
+            line_num_color, line_num_end, marker = "", "", "*"
+        else:
+            line_num_color, line_num_end, marker = Colors.YELLOW, Colors.END, f"{Colors.RED}*{Colors.END}"
+        
+        # Highlight character differences in a worker pool when more than one job is requested
+        executor = None
+        if jobs > 1 and not no_color:
+            executor = stack.enter_context(concurrent.futures.ProcessPoolExecutor(jobs))
+        
+        while True:
+            # Work in batches so the pool gets enough differing lines to amortize its overhead
+            batch = list(itertools.islice(rows, _HIGHLIGHT_BATCH_SIZE))
+            if not batch:
+                break
             
-            # Print all wrapped lines
-            for j, w_line in enumerate(wrapped):
-                if j == 0:  # First line gets the line number
-                    line_num = f"{i:4d} "
-                    print(f"{line_num} {w_line:<{col_width}} | {w_line}")
-                else:  # Continuation lines
-                    print(f"{'':>5} {w_line:<{col_width}} | {w_line}")
+            precomputed = None
+            decoded = None
+            if executor is not None:
+                # Decode differing pairs once, for both the workers and the render loop below
+                changed = [(decode_line(line1), decode_line(line2))
+                           for _, line1, line2 in batch if line1 != line2]
+                decoded = iter(changed)
+                if changed:
+                    precomputed = executor.map(highlight_char_differences, *zip(*changed),
+                                               itertools.repeat(style), chunksize=_HIGHLIGHT_CHUNK_SIZE)
+            
+            for i, line1, line2 in batch:
+                total_lines += 1
+                
+                # Check if lines are different, comparing raw bytes so equal lines skip decoding
+                # twice. A missing side means an inserted or deleted line.
+                if line1 != line2:
+                    diff_count += 1
+                    if decoded is not None:
+                        line1, line2 = next(decoded)
+                    else:
+                        line1 = decode_line(line1)
+                        line2 = decode_line(line2)
+                    
+                    if not no_color:
+                        # Highlight character-level differences
+                        if precomputed is not None:
+                            highlighted1, highlighted2 = next(precomputed)
+                        else:
+                            highlighted1, highlighted2 = highlight_char_differences(line1, line2, style)
+                    else:
+                        highlighted1, highlighted2 = line1, line2
+                    
+                    # Wrap lines if they're too long
+                    wrapped1 = wrap_line(highlighted1, col_width)
+                    wrapped2 = wrap_line(highlighted2, col_width)
+                    
+                    # Make both wrapped lists the same length
+                    max_wrapped = max(len(wrapped1), len(wrapped2))
+                    wrapped1 += ('',) * (max_wrapped - len(wrapped1))
+                    wrapped2 += ('',) * (max_wrapped - len(wrapped2))
+                    
+                    # Print all wrapped lines
+                    for j, (w1, w2) in enumerate(zip(wrapped1, wrapped2)):
+                        if j == 0:  # First line gets the line number and marker
+                            number = '%4d' % i if i is not None else blank_num
+                            emit(row_fmt % (line_num_color + number + line_num_end, marker, w1, w2))
+                        else:  # Continuation lines get spaces
+                            emit(row_fmt % (blank_num, ' ', w1, w2))
+                else:
+                    # Lines are identical
+                    wrapped = wrap_line(decode_line(line1), col_width)
+                    
+                    # Print all wrapped lines
+                    for j, w_line in enumerate(wrapped):
+                        if j == 0:  # First line gets the line number
+                            emit(row_fmt % ('%4d' % i, ' ', w_line, w_line))
+                        else:  # Continuation lines
+                            emit(row_fmt % (blank_num, ' ', w_line, w_line))
     
     # Print summary
-    print("=" * width)
+    emit("=" * width)
     summary_color = Colors.GREEN if diff_count == 0 else Colors.YELLOW
-    summary = f"Comparison complete: {diff_count} differing lines out of {max_lines} total lines"
+    summary = f"Comparison complete: {diff_count} differing lines out of {total_lines} total lines"
     
     if not no_color:
-        print(f"{summary_color}{summary}{Colors.END}")
+        emit(f"{summary_color}{summary}{Colors.END}")
     else:
-        print(summary)
+        emit(summary)
     
     if diff_count > 0 and not no_color:
-        print(f"\nLegend:")
-        print(f"  {Colors.BG_YELLOW}{Colors.BLACK}Yellow background{Colors.END}: Changed blocks of characters")
-        print(f"  {Colors.RED}*{Colors.END}: Line number marker for differing lines")
-        print(f"  Continuation lines are indented without line numbers")
+        emit(f"\nLegend:")
+        if style == 'add-remove':
+            emit(f"  {Colors.BG_RED}Red background{Colors.END}: Characters removed from the first file")
+            emit(f"  {Colors.BG_GREEN}Green background{Colors.END}: Characters added in the second file")
+        else:
+            emit(f"  {Colors.HIGHLIGHT}Yellow background{Colors.END}: Changed blocks of characters")
+        emit(f"  {Colors.RED}*{Colors.END}: Line number marker for differing lines")
+        emit(f"  Lines only in the second file have no line number")
+        emit(f"  Continuation lines are indented without line numbers")
+    
+    flush_output()
 
 def main():
     parser = argparse.ArgumentParser(
@@ -245,6 +607,7 @@ Examples:
   python file_diff.py file1.txt file2.txt
   python file_diff.py config.old config.new --width 120
   python file_diff.py log1.txt log2.txt --no-color
+  python file_diff.py old.py new.py --style add-remove
         """
     )
     
@@ -254,6 +617,13 @@ Examples:
                        help='Display width in characters (default: 120)')
     parser.add_argument('--no-color', action='store_true',
                        help='Disable colored output')
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                       help='Worker processes for highlighting differences (default: 1). '
+                            'Only helps when character highlighting dominates, such as many '
+                            'long changed lines; line alignment always runs in one process')
+    parser.add_argument('--style', choices=list(_STYLES), default='changed-only',
+                       help='Highlight changes in yellow on both sides, or removals in red '
+                            'and additions in green (default: changed-only)')
     
     args = parser.parse_args()
     
@@ -262,7 +632,12 @@ Examples:
         print("Error: Width must be at least 40 characters.")
         sys.exit(1)
     
-    compare_files(args.file1, args.file2, args.width, args.no_color)
+    # Validate jobs
+    if args.jobs < 1:
+        print("Error: Jobs must be at least 1.")
+        sys.exit(1)
+    
+    compare_files(args.file1, args.file2, args.width, args.no_color, args.jobs, args.style)
 
 if __name__ == "__main__":
     main()